@@ -1,41 +1,314 @@
 import os
 import re
+import base64
+import hashlib
+import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Regex to find placeholders like {{FILENAME.txt}}
+# The captured group is the filename including the .txt extension
+PLACEHOLDER_RE = re.compile(r'\{\{([a-zA-Z0-9_.-]+\.txt)\}\}')
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp')
+
+# Bump when the encoding or the substitution logic changes so old caches are discarded
+CACHE_VERSION = 2
+
+# Encoded images in the cache are named after the sha256 of the source image
+CACHE_FILE_RE = re.compile(r'^[0-9a-f]{64}\.b64$')
+
+
+def _sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _resolve_source(placeholder_filename, image_dirs, legacy_dir):
+    """Find the file that backs a placeholder.
+
+    `Banner.txt` or `Banner.png.txt` resolve to a source image such as
+    `Banner.png` in one of `image_dirs`. If no image exists, the pre-encoded
+    file in `legacy_dir` is used so older templates keep building.
+    Returns (path, is_image, legacy_path); legacy_path is the pre-encoded
+    file shadowed by the image, or None.
+    """
+    name = placeholder_filename[:-len('.txt')]
+    stem, ext = os.path.splitext(name)
+    if ext.lower() in IMAGE_EXTENSIONS:
+        candidates = [name]
+    else:
+        candidates = [name + e for e in IMAGE_EXTENSIONS]
+
+    legacy_path = os.path.join(legacy_dir, placeholder_filename)
+    if not os.path.isfile(legacy_path):
+        legacy_path = None
+
+    for image_dir in image_dirs:
+        for candidate in candidates:
+            path = os.path.join(image_dir, candidate)
+            if os.path.isfile(path):
+                return path, True, legacy_path
+
+    if legacy_path is not None:
+        return legacy_path, False, None
+    return None, False, None
+
+
+def _legacy_matches(legacy_path, image_sha):
+    """Check whether a pre-encoded file decodes to the image with hash `image_sha`."""
+    with open(legacy_path, 'r', encoding='utf-8') as f:
+        text = f.read().strip()
+    # Some encoders write a full data URI rather than the bare base64 payload
+    if text.startswith('data:') and ',' in text:
+        text = text.split(',', 1)[1]
+    try:
+        decoded = base64.b64decode(''.join(text.split()), validate=True)
+    except ValueError:
+        return False
+    return hashlib.sha256(decoded).hexdigest() == image_sha
+
+
+def _load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'version': CACHE_VERSION, 'files': {}, 'builds': {}}
+    if manifest.get('version') != CACHE_VERSION:
+        return {'version': CACHE_VERSION, 'files': {}, 'builds': {}}
+    return manifest
+
+
+def _atomic_write(path, write):
+    # Write to a temp file in the same directory, then rename over the target
+    # so readers never see a half-written file
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            write(f)
+        # mkstemp creates the file as 0600; use the permissions a plain open() would give
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _fingerprint(path, manifest_files):
+    """Return the content hash of `path`, reusing the cached one when size and mtime match."""
+    stat = os.stat(path)
+    cached = manifest_files.get(path)
+    if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+        return cached['sha256']
+    sha = _sha256_file(path)
+    manifest_files[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha}
+    return sha
+
+
+def _read_cached(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='ascii') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _encode_image(path, cache_path):
+    """Base64-encode the image at `path` and store the result in `cache_path`.
+
+    May run in a worker process; only the path goes back to the caller so the
+    encoded text is not copied between processes.
+    """
+    with open(path, 'rb') as f:
+        image_data = base64.b64encode(f.read()).decode('ascii')
+    _atomic_write(cache_path, lambda f: f.write(image_data))
+    return cache_path
+
+
+def _prune_cache(cache_dir, manifest):
+    # Drop builds whose output is gone, then every encoded image and file
+    # entry that none of the remaining builds references
+    builds = manifest['builds']
+    for output in list(builds):
+        if not os.path.isfile(output):
+            del builds[output]
+
+    used_paths = set()
+    used_files = set()
+    for build in builds.values():
+        used_paths.update(build['sources'])
+        used_files.update(sha + '.b64' for sha in build['encoded'])
+
+    manifest_files = manifest['files']
+    for path in list(manifest_files):
+        if path not in used_paths:
+            del manifest_files[path]
+
+    for filename in os.listdir(cache_dir):
+        # The pattern skips temp files that another build is still writing
+        if CACHE_FILE_RE.match(filename) and filename not in used_files:
+            try:
+                os.remove(os.path.join(cache_dir, filename))
+            except OSError as e:
+                print(f"Warning: could not remove stale cache file {filename}: {e}")
+
+
+def build_documentation(template_path, output_path, image_dirs=None, legacy_dir=None,
+                        cache_dir=None, max_workers=None):
+    project_root = os.path.dirname(os.path.abspath(__file__))
+    docs_dir = os.path.join(project_root, 'Documentacion')
+    if image_dirs is None:
+        image_dirs = [os.path.join(docs_dir, 'Imagenes'), os.path.join(project_root, 'app', 'static')]
+    if legacy_dir is None:
+        legacy_dir = os.path.join(docs_dir, 'Base64_Output')
+    if cache_dir is None:
+        cache_dir = os.path.join(docs_dir, '.build_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    manifest = _load_manifest(manifest_path)
+    loaded_manifest = json.dumps(manifest, sort_keys=True)
 
-def build_documentation(template_path, output_path):
     # Read the content of the template file
     with open(template_path, 'r', encoding='utf-8') as f:
         content = f.read()
 
-    # Regex to find placeholders like {{FILENAME.txt}}
-    # This regex captures the filename including the .txt extension
-    placeholders = re.findall(r'\{\{([a-zA-Z0-9_.-]+\.txt)\}\}', content)
+    placeholders = set(PLACEHOLDER_RE.findall(content))
+    sources = {}
+    shadowed = {}
+    for placeholder_filename in placeholders:
+        path, is_image, legacy_path = _resolve_source(placeholder_filename, image_dirs, legacy_dir)
+        if path is None:
+            print(f"Warning: no image or Base64 file found for {placeholder_filename}. Placeholder will remain.")
+            continue
+        sources[placeholder_filename] = (path, is_image)
+        if legacy_path is not None:
+            shadowed[placeholder_filename] = legacy_path
 
-    # Construct the absolute path to the Base64_Output directory
-    # Assuming build_docs.py is in the project root
-    project_root = os.path.dirname(os.path.abspath(__file__))
-    base64_output_dir = os.path.join(project_root, 'Documentacion', 'Base64_Output')
+    hashes = {}
+    for name, (path, _) in list(sources.items()):
+        try:
+            hashes[name] = _fingerprint(path, manifest['files'])
+        except OSError as e:
+            print(f"Error reading {path}: {e}")
+            del sources[name]
 
-    for placeholder_filename in placeholders:
-        base64_file_path = os.path.join(base64_output_dir, placeholder_filename)
+    # The output only depends on the template and the content of each resolved source
+    build_key = hashlib.sha256()
+    build_key.update(hashlib.sha256(content.encode('utf-8')).digest())
+    for name in sorted(sources):
+        build_key.update(f'\0{name}\0{sources[name][1]}\0{hashes[name]}'.encode('utf-8'))
+    build_key = build_key.hexdigest()
+
+    def save_manifest():
+        # Skip the write when nothing changed so an up-to-date build touches no files
+        if json.dumps(manifest, sort_keys=True) != loaded_manifest:
+            _atomic_write(manifest_path, lambda f: json.dump(manifest, f, indent=2))
+
+    # Each output keeps its own record so several documents can share one cache
+    output_key = os.path.abspath(output_path)
+    previous = manifest['builds'].get(output_key)
+    if previous and previous['build_key'] == build_key and os.path.isfile(output_path):
+        _prune_cache(cache_dir, manifest)
+        save_manifest()
+        print(f"Documentation is up to date: {output_path}")
+        return False
+
+    # An image takes priority over its pre-encoded file; say so when they disagree
+    for name, legacy_path in sorted(shadowed.items()):
         try:
-            with open(base64_file_path, 'r', encoding='utf-8') as f:
-                image_data = f.read()
-            # Replace the placeholder with the actual image data
-            content = content.replace(f'{{{{{placeholder_filename}}}}}', image_data)
-        except FileNotFoundError:
-            print(f"Warning: Base64 file not found for {base64_file_path}. Placeholder will remain.")
+            if not _legacy_matches(legacy_path, hashes[name]):
+                print(f"Warning: {sources[name][0]} differs from {legacy_path}; using the image.")
+        except OSError as e:
+            print(f"Error reading {legacy_path}: {e}")
+
+    # Legacy files are already base64 and cached images only need reading;
+    # the remaining images are encoded, in worker processes when there are several
+    replacements = {}
+    to_encode = {}
+    for name, (path, is_image) in sources.items():
+        try:
+            if not is_image:
+                with open(path, 'r', encoding='utf-8') as f:
+                    replacements[name] = f.read()
+                continue
+            cache_path = os.path.join(cache_dir, hashes[name] + '.b64')
+            image_data = _read_cached(cache_path)
+            if image_data is None:
+                to_encode[name] = cache_path
+            else:
+                replacements[name] = image_data
         except Exception as e:
-            print(f"Error reading {base64_file_path}: {e}")
+            print(f"Error reading {path}: {e}")
 
-    # Write the modified content to the output file
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(content)
+    encoded_paths = {}
+    if len(to_encode) == 1:
+        (name, cache_path), = to_encode.items()
+        try:
+            encoded_paths[name] = _encode_image(sources[name][0], cache_path)
+        except Exception as e:
+            print(f"Error reading {sources[name][0]}: {e}")
+    elif to_encode:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                name: executor.submit(_encode_image, sources[name][0], cache_path)
+                for name, cache_path in to_encode.items()
+            }
+            for name, future in futures.items():
+                try:
+                    encoded_paths[name] = future.result()
+                except Exception as e:
+                    print(f"Error reading {sources[name][0]}: {e}")
+
+    for name, cache_path in encoded_paths.items():
+        image_data = _read_cached(cache_path)
+        if image_data is None:
+            print(f"Error reading {cache_path}: cache entry disappeared")
+        else:
+            replacements[name] = image_data
+
+    # Single pass over the template, streaming each chunk straight to the temp file
+    def write_output(f):
+        position = 0
+        for match in PLACEHOLDER_RE.finditer(content):
+            image_data = replacements.get(match.group(1))
+            if image_data is None:
+                continue
+            f.write(content[position:match.start()])
+            f.write(image_data)
+            position = match.end()
+        f.write(content[position:])
+
+    _atomic_write(output_path, write_output)
+
+    # A source that resolved but could not be read or encoded leaves the build
+    # unrecorded so it is retried. Placeholders with no file at all are part of
+    # the build key already: adding the image later changes `sources`.
+    complete = len(replacements) == len(sources)
+    manifest['builds'][output_key] = {
+        'build_key': build_key if complete else None,
+        'sources': sorted(path for path, _ in sources.values()),
+        'encoded': sorted(hashes[name] for name, (_, is_image) in sources.items() if is_image),
+    }
+    _prune_cache(cache_dir, manifest)
+    save_manifest()
     print(f"Documentation built successfully: {output_path}")
+    return True
+
 
 if __name__ == "__main__":
     # Define paths relative to the project root
     project_root = os.path.dirname(os.path.abspath(__file__))
-    
+
     template_path = os.path.join(project_root, 'Documentacion', 'template_documentacion.html')
     output_path = os.path.join(project_root, 'Documentacion', 'documentacion_tecnica.html')
 
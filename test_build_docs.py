@@ -0,0 +1,117 @@
+import os
+import base64
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+import build_docs
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static')
+
+
+class BuildDocumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.image_dir = os.path.join(self.root, 'img')
+        self.legacy_dir = os.path.join(self.root, 'legacy')
+        self.cache_dir = os.path.join(self.root, 'cache')
+        os.makedirs(self.image_dir)
+        os.makedirs(self.legacy_dir)
+        shutil.copy(os.path.join(STATIC_DIR, 'Banner.png'), self.image_dir)
+        shutil.copy(os.path.join(STATIC_DIR, 'OsoAnteojos.png'), self.image_dir)
+        with open(os.path.join(self.legacy_dir, 'Old.txt'), 'w', encoding='utf-8') as f:
+            f.write('QUJD')
+        self.template = os.path.join(self.root, 'template.html')
+        self.output = os.path.join(self.root, 'out.html')
+        self.write_template('<img src="{{Banner.txt}}"> [{{Old.txt}}] {{OsoAnteojos.png.txt}} {{Missing.txt}}\n')
+
+    def write_template(self, text):
+        with open(self.template, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def build(self, output=None):
+        with redirect_stdout(StringIO()):
+            return build_docs.build_documentation(
+                self.template, output or self.output, image_dirs=[self.image_dir],
+                legacy_dir=self.legacy_dir, cache_dir=self.cache_dir)
+
+    def encoded(self, name):
+        with open(os.path.join(self.image_dir, name), 'rb') as f:
+            return base64.b64encode(f.read()).decode('ascii')
+
+    def cached_files(self):
+        return sorted(f for f in os.listdir(self.cache_dir) if f.endswith('.b64'))
+
+    def test_substitutes_every_placeholder_in_one_pass(self):
+        self.assertTrue(self.build())
+        with open(self.output, 'r', encoding='utf-8') as f:
+            output = f.read()
+        expected = '<img src="{}"> [QUJD] {} {{{{Missing.txt}}}}\n'.format(
+            self.encoded('Banner.png'), self.encoded('OsoAnteojos.png'))
+        self.assertEqual(output, expected)
+        # Only encoded images are cached, not the pre-encoded legacy file
+        self.assertEqual(len(self.cached_files()), 2)
+
+    def test_unchanged_build_is_a_no_op(self):
+        self.assertTrue(self.build())
+        output_mtime = os.stat(self.output).st_mtime_ns
+        manifest_mtime = os.stat(os.path.join(self.cache_dir, 'manifest.json')).st_mtime_ns
+        self.assertFalse(self.build())
+        self.assertFalse(self.build())
+        self.assertEqual(os.stat(self.output).st_mtime_ns, output_mtime)
+        self.assertEqual(os.stat(os.path.join(self.cache_dir, 'manifest.json')).st_mtime_ns, manifest_mtime)
+
+    def test_touched_image_hits_the_cache(self):
+        self.assertTrue(self.build())
+        banner = os.path.join(self.image_dir, 'Banner.png')
+        stat = os.stat(banner)
+        os.utime(banner, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertFalse(self.build())
+
+        # A template change rebuilds the output but must not re-encode anything
+        self.write_template('{{Banner.txt}} {{OsoAnteojos.png.txt}}')
+        original = build_docs._encode_image
+        build_docs._encode_image = None
+        try:
+            self.assertTrue(self.build())
+        finally:
+            build_docs._encode_image = original
+
+    def test_prunes_unused_entries(self):
+        self.assertTrue(self.build())
+        leftover = os.path.join(self.cache_dir, '.tmp-abc' + '0' * 64 + '.b64')
+        open(leftover, 'w').close()
+        self.write_template('{{Banner.txt}}')
+        self.assertTrue(self.build())
+        self.assertEqual(self.cached_files(), sorted([
+            build_docs._sha256_file(os.path.join(self.image_dir, 'Banner.png')) + '.b64',
+            os.path.basename(leftover),
+        ]))
+
+    def test_outputs_share_the_cache(self):
+        other = os.path.join(self.root, 'out2.html')
+        self.assertTrue(self.build())
+        self.assertTrue(self.build(other))
+        self.assertFalse(self.build())
+        self.assertFalse(self.build(other))
+        self.assertEqual(len(self.cached_files()), 2)
+
+    def test_warns_when_image_and_legacy_file_differ(self):
+        with open(os.path.join(self.legacy_dir, 'Banner.txt'), 'w', encoding='utf-8') as f:
+            f.write('QUJD')
+        with open(os.path.join(self.legacy_dir, 'OsoAnteojos.png.txt'), 'w', encoding='utf-8') as f:
+            f.write(self.encoded('OsoAnteojos.png'))
+        out = StringIO()
+        with redirect_stdout(out):
+            build_docs.build_documentation(
+                self.template, self.output, image_dirs=[self.image_dir],
+                legacy_dir=self.legacy_dir, cache_dir=self.cache_dir)
+        self.assertIn('Banner.png differs from', out.getvalue())
+        self.assertNotIn('OsoAnteojos.png differs from', out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()